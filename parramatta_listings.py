@@ -1,6 +1,7 @@
 import requests
 from bs4 import BeautifulSoup
 from fpdf import FPDF
+from fpdf.enums import XPos, YPos
 from geopy.distance import geodesic
 
 # Constants
@@ -82,21 +83,21 @@ def scrape_realestate():
 def make_pdf(listings, filename="Parramatta_Listings.pdf"):
     pdf = FPDF()
     pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    pdf.cell(200, 10, "Parramatta Property Listings", ln=True, align="C")
+    pdf.set_font("Helvetica", size=12)
+    pdf.cell(200, 10, "Parramatta Property Listings", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align="C")
 
     for prop in listings:
         pdf.ln(8)
-        pdf.set_font("Arial", "B", 12)
-        pdf.multi_cell(0, 8, f"{prop['title']} - ${prop['price']}")
-        pdf.set_font("Arial", size=10)
-        pdf.multi_cell(0, 6, f"{prop['beds']} bed, {prop['baths']} bath, {prop['cars']} car")
-        pdf.multi_cell(0, 6, f"Address: {prop['address']}")
+        pdf.set_font("Helvetica", "B", 12)
+        pdf.multi_cell(0, 8, f"{prop['title']} - ${prop['price']}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        pdf.set_font("Helvetica", size=10)
+        pdf.multi_cell(0, 6, f"{prop['beds']} bed, {prop['baths']} bath, {prop['cars']} car", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        pdf.multi_cell(0, 6, f"Address: {prop['address']}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
         if prop['dist_station']:
-            pdf.multi_cell(0, 6, f"Distance: {prop['dist_station']} km to station, {prop['dist_park']} km to park")
-        pdf.multi_cell(0, 6, "Pros: " + ", ".join(prop['pros']))
-        pdf.multi_cell(0, 6, "Cons: " + ", ".join(prop['cons']))
-        pdf.multi_cell(0, 6, f"Link: {prop['link']}")
+            pdf.multi_cell(0, 6, f"Distance: {prop['dist_station']} km to station, {prop['dist_park']} km to park", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        pdf.multi_cell(0, 6, "Pros: " + ", ".join(prop['pros']), new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        pdf.multi_cell(0, 6, "Cons: " + ", ".join(prop['cons']), new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        pdf.multi_cell(0, 6, f"Link: {prop['link']}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
         pdf.line(10, pdf.get_y(), 200, pdf.get_y())
 
     pdf.output(filename)
@@ -1,9 +1,15 @@
 # scraper.py
 import os
+import json
 import requests
+from requests.adapters import HTTPAdapter
 import math
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from fpdf import FPDF
-from time import sleep
+from fpdf.enums import XPos, YPos
+from time import monotonic, sleep
 
 # --- configurable via env / secrets ---
 RAPIDAPI_KEY = os.getenv("RAPIDAPI_KEY")
@@ -16,85 +22,165 @@ MIN_BEDS = int(os.getenv("SEARCH_MIN_BEDS", "1"))
 MAX_BEDS = int(os.getenv("SEARCH_MAX_BEDS", "2"))
 MIN_CARSPACES = int(os.getenv("SEARCH_MIN_CARSPACES", "1"))
 LIMIT = int(os.getenv("SEARCH_LIMIT", "40"))
+GEO_CACHE_PATH = os.getenv("GEO_CACHE_PATH", ".geocache.json")  # address -> [lat, lon], kept between runs
+GEOCODE_WORKERS = int(os.getenv("GEOCODE_WORKERS", "2"))
+GEOCODE_MISSING = os.getenv("GEOCODE_MISSING", "1") == "1"  # 0: only use coords from the API / geocode cache
 
 # Parramatta station / park coordinates (for distance)
 STATION_COORDS = (-33.8178, 151.0035)
 PARK_COORDS = (-33.8145, 151.0024)
+# FCC km-per-degree coefficients at Parramatta's latitude, for fcc_many_km
+MEAN_LAT_R = math.radians(-33.815)
+KM_PER_DEG_LAT = 111.13209 - 0.56605*math.cos(2*MEAN_LAT_R) + 0.00120*math.cos(4*MEAN_LAT_R)
+KM_PER_DEG_LON = 111.41513*math.cos(MEAN_LAT_R) - 0.09455*math.cos(3*MEAN_LAT_R) + 0.00012*math.cos(5*MEAN_LAT_R)
+# station / park on the local km grid used by fcc_many_km, computed once
+STATION_XY = (STATION_COORDS[1] * KM_PER_DEG_LON, STATION_COORDS[0] * KM_PER_DEG_LAT)
+PARK_XY = (PARK_COORDS[1] * KM_PER_DEG_LON, PARK_COORDS[0] * KM_PER_DEG_LAT)
+
+# common field names that hold the list of listings
+LISTINGS_KEYS = ("properties", "listings", "results", "data", "items")
+# common key names for each listing field, most likely first
+KEYS_PRICE = ("price", "price_display", "price_value", "price_min", "asking_price")
+KEYS_BEDS = ("bedrooms", "beds", "bed")
+KEYS_BATHS = ("bathrooms", "baths", "bath")
+KEYS_CARS = ("carspaces", "cars", "parking", "car")
+KEYS_ADDRESS = ("address", "full_address", "displayable_address", "formatted_address")
+KEYS_URL = ("url", "ldp_url", "listing_url", "detail_url")
+KEYS_LAT = ("lat", "latitude")
+KEYS_LON = ("lon", "lng", "longitude")
+_PRICE_RE = re.compile(r"\d+")
+
+# (predicate(beds, baths, cars, price), "pros"/"cons", text); each pair of
+# rules on the same field is mutually exclusive
+PROS_CONS_RULES = (
+    (lambda beds, baths, cars, price: cars and cars >= 1, "pros", "Has 1+ car space"),
+    (lambda beds, baths, cars, price: not (cars and cars >= 1), "cons", "No dedicated parking listed"),
+    (lambda beds, baths, cars, price: beds == 2 and baths and baths >= 2, "pros", "2 beds + 2 baths"),
+    (lambda beds, baths, cars, price: beds == 2 and (not baths or baths == 1), "cons", "Only 1 bath for 2 beds"),
+    (lambda beds, baths, cars, price: price and price <= (MAX_PRICE - 50000), "pros", "Good value under budget"),
+    (lambda beds, baths, cars, price: price and price >= (MAX_PRICE - 10000), "cons", "Close to top of budget"),
+)
+
+# Nominatim rate limit state, shared by geocode_one workers
+_geocode_lock = threading.Lock()
+_last_geocode = 0.0
 
 # ---- helpers ----
 def km_to_walk_minutes(km):
     # ~5 km/h walking speed => 12 min per km
     return int(round(km * 12))
 
-def haversine_km(lat1, lon1, lat2, lon2):
-    # simple haversine distance (km)
-    R = 6371.0
-    import math
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
-    return R * 2 * math.asin(math.sqrt(a))
+def fcc_many_km(points, origins_xy):
+    # FCC flat-earth distance (km) from every (lat, lon) in points to each
+    # origin in origins_xy (see STATION_XY). Every point is in Parramatta, so
+    # one pair of km-per-degree factors projects them all onto a local km
+    # grid; within metres of geodesic over a few km. Each point is projected
+    # once and measured against every origin.
+    out = []
+    for lat, lon in points:
+        x, y = lon * KM_PER_DEG_LON, lat * KM_PER_DEG_LAT
+        out.append([math.sqrt((x - x0)**2 + (y - y0)**2) for x0, y0 in origins_xy])
+    return out
+
+def load_geo_cache(path=GEO_CACHE_PATH):
+    # normalised Nominatim query -> [lat, lon], or None if it didn't resolve
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def save_geo_cache(cache, path=GEO_CACHE_PATH):
+    try:
+        with open(path, "w") as f:
+            json.dump(cache, f)
+    except Exception as e:
+        debug_print(f"Couldn't write geocode cache {path}: {e}")
+
+def make_session():
+    # one pooled keep-alive session for the API and Nominatim calls
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    session.headers.update({"User-Agent": "parramatta-bot/1.0"})
+    return session
+
+def geocode_one(session, q):
+    # use Nominatim open API (be kind — rate limit): requests start at
+    # least 1 s apart, but workers overlap their network round-trips
+    global _last_geocode
+    with _geocode_lock:
+        wait = _last_geocode + 1.0 - monotonic()
+        if wait > 0:
+            sleep(wait)
+        _last_geocode = monotonic()
+    geocode_url = "https://nominatim.openstreetmap.org/search"
+    rgeo = session.get(geocode_url, params={"q": q, "format":"json","limit":1}, timeout=10)
+    geodata = rgeo.json()
+    if geodata:
+        return [float(geodata[0]["lat"]), float(geodata[0]["lon"])]
+    return None
 
 def debug_print(s):
     print(s)
 
 def find_listings_container(j):
     # Look for common field names that hold a list of listings
-    candidates = ["properties", "listings", "results", "data", "items"]
-    if isinstance(j, dict):
-        for k in candidates:
-            if k in j and isinstance(j[k], list):
-                return j[k]
+    if type(j) is dict:
+        for k in LISTINGS_KEYS:
+            v = j.get(k)
+            if type(v) is list:
+                return v
         # fallback: find first list of dicts
-        for k,v in j.items():
-            if isinstance(v, list) and len(v) and isinstance(v[0], dict):
+        for v in j.values():
+            if type(v) is list and v and type(v[0]) is dict:
                 return v
-    if isinstance(j, list):
+    if type(j) is list:
         return j
     return None
 
-def try_get(o, keys):
+def _first(d, keys):
+    # value of the first key in keys that d has (and isn't None)
     for k in keys:
-        if isinstance(o, dict) and k in o:
-            return o[k]
+        v = d.get(k)
+        if v is not None:
+            return v
     return None
 
-def extract_field(listing):
-    # try multiple common key names
-    price = try_get(listing, ["price", "price_display", "price_value", "price_min", "asking_price"])
-    beds = try_get(listing, ["bedrooms", "beds", "bed"])
-    baths = try_get(listing, ["bathrooms", "baths", "bath"])
-    cars = try_get(listing, ["carspaces", "cars", "parking", "car"])
-    address = try_get(listing, ["address", "full_address", "displayable_address", "formatted_address"])
-    url = try_get(listing, ["url", "ldp_url", "listing_url", "detail_url"])
-    lat = try_get(listing, ["lat", "latitude"])
-    lon = try_get(listing, ["lon", "lng", "longitude"])
-    # simple sanitise
+def _to_int(x):
+    # int value of a JSON number or numeric string, else None
+    if x is None or x == "":
+        return None
+    if type(x) is int:
+        return x
     try:
-        price_val = None
-        if isinstance(price, (int, float)):
-            price_val = int(price)
-        elif isinstance(price, str):
-            import re
-            nums = re.findall(r"\d+", price.replace(",", ""))
-            if nums:
-                price_val = int("".join(nums))
+        return int(x)
     except Exception:
-        price_val = None
+        return None
 
-    try:
-        beds = int(beds) if beds not in (None, "") else None
-    except Exception:
-        beds = None
-    try:
-        baths = int(baths) if baths not in (None, "") else None
-    except Exception:
-        baths = None
-    try:
-        cars = int(cars) if cars not in (None, "") else None
-    except Exception:
-        cars = None
+def _parse_price(price):
+    # "$480,000" -> 480000; text without digits ("Contact agent") -> None
+    if type(price) is str:
+        nums = _PRICE_RE.findall(price.replace(",", ""))
+        return int("".join(nums)) if nums else None
+    return _to_int(price)
+
+def extract_field(listing):
+    if not isinstance(listing, dict):
+        listing = {}
+    # try multiple common key names
+    price = _first(listing, KEYS_PRICE)
+    beds = _first(listing, KEYS_BEDS)
+    baths = _first(listing, KEYS_BATHS)
+    cars = _first(listing, KEYS_CARS)
+    address = _first(listing, KEYS_ADDRESS)
+    url = _first(listing, KEYS_URL)
+    lat = _first(listing, KEYS_LAT)
+    lon = _first(listing, KEYS_LON)
+    # simple sanitise
+    price_val = _parse_price(price)
+    beds = _to_int(beds)
+    baths = _to_int(baths)
+    cars = _to_int(cars)
 
     return {
         "price_raw": price,
@@ -105,9 +191,61 @@ def extract_field(listing):
         "address": address,
         "url": url,
         "lat": lat,
-        "lon": lon
+        "lon": lon,
+        "dist_station_km": None,
+        "dist_park_km": None
     }
 
+def _price_is_exact(price_raw):
+    # True unless price_raw is text with several digit runs ("$450,000 - $495,000",
+    # "480000.50"), which _parse_price joins into one meaningless number
+    if type(price_raw) is not str:
+        return True
+    return len(_PRICE_RE.findall(price_raw.replace(",", ""))) == 1
+
+def matches_search(item):
+    # False if a known value is outside the search bounds; unknowns pass
+    if item["price"] is not None and item["price"] > MAX_PRICE and _price_is_exact(item["price_raw"]):
+        return False
+    if item["beds"] is not None and not (MIN_BEDS <= item["beds"] <= MAX_BEDS):
+        return False
+    if item["cars"] is not None and item["cars"] < MIN_CARSPACES:
+        return False
+    return True
+
+def pros_and_cons(item):
+    # pros/cons simple logic
+    beds, baths, cars, price = item["beds"], item["baths"], item["cars"], item["price"]
+    pros = []
+    cons = []
+    for pred, bucket, text in PROS_CONS_RULES:
+        if pred(beds, baths, cars, price):
+            (pros if bucket == "pros" else cons).append(text)
+    return pros, cons
+
+def format_listing(i):
+    # (heading, body) text for one PDF entry; body lines are joined with
+    # newlines so they lay out in a single multi_cell
+    title = i.get("address") or str(i.get("url") or "Property")
+    price_text = i.get("price_raw") or (f"${i.get('price')}" if i.get("price") else "Price unknown")
+    beds = i.get("beds") or "?"
+    baths = i.get("baths") or "?"
+    cars = i.get("cars") or "?"
+    lines = [f"{beds} bed | {baths} bath | {cars} car"]
+    if i.get("url"):
+        lines.append(f"Link: {i.get('url')}")
+    if i["dist_station_km"] is not None:
+        mins = km_to_walk_minutes(i["dist_station_km"])
+        lines.append(f"Distance: {i['dist_station_km']} km to station (~{mins} min walk)")
+    if i["dist_park_km"] is not None:
+        mins2 = km_to_walk_minutes(i["dist_park_km"])
+        lines.append(f"Distance: {i['dist_park_km']} km to Parramatta Park (~{mins2} min walk)")
+    if i["pros"]:
+        lines.append("Pros: " + ", ".join(i["pros"]))
+    if i["cons"]:
+        lines.append("Cons: " + ", ".join(i["cons"]))
+    return f"{title} — {price_text}", "\n".join(lines)
+
 # ---- main ----
 def run_search_and_build_pdf():
     if not RAPIDAPI_KEY or not RAPIDAPI_HOST:
@@ -132,112 +270,101 @@ def run_search_and_build_pdf():
     }
 
     debug_print(f"Requesting {url} with params {params} ...")
-    r = requests.get(url, headers=headers, params=params, timeout=30)
-    debug_print(f"Status: {r.status_code}")
-    if r.status_code != 200:
-        debug_print("Response text (truncated):")
-        debug_print(r.text[:1000])
-        raise SystemExit("API request failed. Check host/key/params in RapidAPI UI.")
-
-    j = r.json()
-    listings = find_listings_container(j)
-    if not listings:
-        debug_print("Couldn't find listings in response. Dumping JSON keys for troubleshooting:")
-        debug_print(list(j.keys()) if isinstance(j, dict) else str(type(j)))
-        raise SystemExit("No listings container found. Please paste a small sample JSON and I will adapt the script.")
-
-    props = []
-    for L in listings:
-        item = extract_field(L)
-        # geocode if lat/lon missing *attempt* (rate limit friendly: sleep)
-        if item["lat"] is None or item["lon"] is None:
-            if item["address"]:
-                # use Nominatim open API (be kind — rate limit)
-                try:
+    with make_session() as session:
+        r = session.get(url, headers=headers, params=params, timeout=30)
+        debug_print(f"Status: {r.status_code}")
+        if r.status_code != 200:
+            debug_print("Response text (truncated):")
+            debug_print(r.text[:1000])
+            raise SystemExit("API request failed. Check host/key/params in RapidAPI UI.")
+
+        j = r.json()
+        listings = find_listings_container(j)
+        if not listings:
+            debug_print("Couldn't find listings in response. Dumping JSON keys for troubleshooting:")
+            debug_print(list(j.keys()) if isinstance(j, dict) else str(type(j)))
+            raise SystemExit("No listings container found. Please paste a small sample JSON and I will adapt the script.")
+
+        geo_cache = load_geo_cache()
+        items = []
+        needs_geo = []  # (index into items, normalised query)
+        queries = {}  # normalised query -> query, for addresses not in the cache
+        filtered = 0
+        for L in listings:
+            item = extract_field(L)
+            # the API may ignore search params; drop mismatches before any geocoding
+            if not matches_search(item):
+                filtered += 1
+                continue
+            item["pros"], item["cons"] = pros_and_cons(item)
+
+            # geocode if lat/lon missing *attempt*
+            if item["lat"] is None or item["lon"] is None:
+                if item["address"]:
                     q = f"{item['address']}, Parramatta NSW"
-                    geocode_url = "https://nominatim.openstreetmap.org/search"
-                    rgeo = requests.get(geocode_url, params={"q": q, "format":"json","limit":1}, headers={"User-Agent":"parramatta-bot/1.0"}, timeout=10)
-                    geodata = rgeo.json()
-                    if geodata:
-                        item["lat"] = float(geodata[0]["lat"])
-                        item["lon"] = float(geodata[0]["lon"])
-                        sleep(1)  # be gentle
-                except Exception:
-                    pass
-
-        # distance calc if lat/lon exists
-        dist_station_km = None
-        dist_park_km = None
+                    key = q.strip().lower()
+                    needs_geo.append((len(items), key))
+                    if key not in geo_cache:
+                        queries[key] = q
+            items.append(item)
+        if filtered:
+            debug_print(f"Filtered out {filtered} listing(s) outside the search bounds")
+
+        if queries and not GEOCODE_MISSING:
+            debug_print(f"Skipping geocoding for {len(queries)} uncached address(es) (GEOCODE_MISSING=0)")
+        elif queries:
+            debug_print(f"Geocoding {len(queries)} address(es) ...")
+            with ThreadPoolExecutor(max_workers=GEOCODE_WORKERS) as executor:
+                futures = {executor.submit(geocode_one, session, q): key for key, q in queries.items()}
+                for fut in as_completed(futures):
+                    try:
+                        # cache misses as None too, so unknown addresses aren't retried every run
+                        geo_cache[futures[fut]] = fut.result()
+                    except Exception:
+                        pass
+            save_geo_cache(geo_cache)
+        for idx, key in needs_geo:
+            if geo_cache.get(key):
+                items[idx]["lat"], items[idx]["lon"] = geo_cache[key]
+
+    # distance calc for every listing with lat/lon: one pass, both landmarks
+    located = []
+    points = []
+    for idx, item in enumerate(items):
         if item["lat"] and item["lon"]:
             try:
-                dist_station_km = round(haversine_km(float(item["lat"]), float(item["lon"]), STATION_COORDS[0], STATION_COORDS[1]), 2)
-                dist_park_km = round(haversine_km(float(item["lat"]), float(item["lon"]), PARK_COORDS[0], PARK_COORDS[1]), 2)
+                points.append((float(item["lat"]), float(item["lon"])))
+                located.append(idx)
             except Exception:
                 pass
-
-        # pros/cons simple logic
-        pros = []
-        cons = []
-        if item["cars"] and item["cars"] >= 1:
-            pros.append("Has 1+ car space")
-        else:
-            cons.append("No dedicated parking listed")
-
-        if item["beds"] == 2 and item["baths"] and item["baths"] >= 2:
-            pros.append("2 beds + 2 baths")
-        elif item["beds"] == 2 and (not item["baths"] or item["baths"] == 1):
-            cons.append("Only 1 bath for 2 beds")
-
-        if item["price"] and item["price"] <= (MAX_PRICE - 50000):
-            pros.append("Good value under budget")
-        elif item["price"] and item["price"] >= (MAX_PRICE - 10000):
-            cons.append("Close to top of budget")
-
-        props.append({
-            "raw": item,
-            "dist_station_km": dist_station_km,
-            "dist_park_km": dist_park_km,
-            "pros": pros,
-            "cons": cons
-        })
+    for idx, (d_station, d_park) in zip(located, fcc_many_km(points, (STATION_XY, PARK_XY))):
+        items[idx]["dist_station_km"] = round(d_station, 2)
+        items[idx]["dist_park_km"] = round(d_park, 2)
 
     # --- Make PDF ---
     pdf = FPDF()
+    pdf.core_fonts_encoding = "windows-1252"  # core fonts are WinAnsi; allows the em dash in headings
     pdf.set_auto_page_break(True, margin=15)
     pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    pdf.cell(0, 8, "Parramatta Property Listings (Under ${})".format(MAX_PRICE), ln=True, align="C")
+    pdf.set_font("Helvetica", size=12)
+    pdf.cell(0, 8, "Parramatta Property Listings (Under ${})".format(MAX_PRICE), new_x=XPos.LMARGIN, new_y=YPos.NEXT, align="C")
     pdf.ln(6)
 
-    for p in props:
-        i = p["raw"]
-        title = i.get("address") or str(i.get("url") or "Property")
-        price_text = i.get("price_raw") or (f"${i.get('price')}" if i.get("price") else "Price unknown")
-        pdf.set_font("Arial", "B", 11)
-        pdf.multi_cell(0, 7, f"{title} — {price_text}")
-        pdf.set_font("Arial", size=10)
-        beds = i.get("beds") or "?"
-        baths = i.get("baths") or "?"
-        cars = i.get("cars") or "?"
-        pdf.multi_cell(0, 6, f"{beds} bed | {baths} bath | {cars} car")
-        if i.get("url"):
-            pdf.multi_cell(0, 6, f"Link: {i.get('url')}")
-        if p["dist_station_km"] is not None:
-            mins = km_to_walk_minutes(p["dist_station_km"])
-            pdf.multi_cell(0, 6, f"Distance: {p['dist_station_km']} km to station (~{mins} min walk)")
-        if p["dist_park_km"] is not None:
-            mins2 = km_to_walk_minutes(p["dist_park_km"])
-            pdf.multi_cell(0, 6, f"Distance: {p['dist_park_km']} km to Parramatta Park (~{mins2} min walk)")
-        if p["pros"]:
-            pdf.multi_cell(0, 6, "Pros: " + ", ".join(p["pros"]))
-        if p["cons"]:
-            pdf.multi_cell(0, 6, "Cons: " + ", ".join(p["cons"]))
+    # pre-format every entry, so the PDF loop only does layout
+    entries = [format_listing(item) for item in items]
+    for heading, body in entries:
+        pdf.set_font("Helvetica", "B", 11)
+        pdf.multi_cell(0, 7, heading, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        pdf.set_font("Helvetica", size=10)
+        pdf.multi_cell(0, 6, body, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
         pdf.ln(3)
         pdf.line(10, pdf.get_y(), 200, pdf.get_y())
         pdf.ln(4)
 
     outname = "listings.pdf"
-    pdf.output(outname)
+    data = pdf.output()  # fpdf2 builds the whole document in memory
+    with open(outname, "wb") as f:
+        f.write(data)
     print("PDF written:", outname)
 
 if __name__ == "__main__":